@@ -3,8 +3,8 @@
 # Based on https://github.com/logpai/logparser/blob/master/logparser/Drain/Drain.py by LogPAI team
 
 from abc import ABC, abstractmethod
-from typing import cast, Collection, IO, Iterable, MutableMapping, MutableSequence, Optional, Sequence, Tuple, \
-    TYPE_CHECKING, TypeVar, Union
+from typing import Any, cast, Collection, Dict, IO, Iterable, Mapping, MutableMapping, MutableSequence, Optional, \
+    Pattern, Sequence, Tuple, TYPE_CHECKING, TypeVar, Union
 
 from cachetools import LRUCache, Cache
 
@@ -12,15 +12,45 @@ from drain3.simple_profiler import Profiler, NullProfiler
 
 
 class LogCluster:
-    __slots__ = ["log_template_tokens", "cluster_id", "size"]
+    __slots__ = ["log_template_tokens", "cluster_id", "size", "_template"]
 
     def __init__(self, log_template_tokens: Iterable[str], cluster_id: int) -> None:
         self.log_template_tokens = tuple(log_template_tokens)
         self.cluster_id = cluster_id
         self.size = 1
+        self._template: Optional[str] = None
+
+    def set_template_tokens(self, log_template_tokens: Iterable[str]) -> None:
+        """
+        Replace the template tokens of the cluster. Use this rather than assigning `log_template_tokens`
+        directly, so that the cached template string is invalidated.
+        """
+        self.log_template_tokens = tuple(log_template_tokens)
+        self._template = None
 
     def get_template(self) -> str:
-        return ' '.join(self.log_template_tokens)
+        template = self._template
+        if template is None:
+            template = ' '.join(self.log_template_tokens)
+            self._template = template
+        return template
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the cached template string is derived from the tokens, so it is left out of snapshots
+        return {"log_template_tokens": self.log_template_tokens, "cluster_id": self.cluster_id, "size": self.size}
+
+    def __setstate__(self, state: Mapping[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._template = None
+
+    if not TYPE_CHECKING:  # keep attribute access type-checked
+        def __getattr__(self, name: str) -> Any:
+            # only called for unset attributes: snapshots taken before template caching are restored
+            # without __setstate__, so their clusters have no _template yet
+            if name == "_template":
+                return None
+            raise AttributeError(name)
 
     def __str__(self) -> str:
         return f"ID={str(self.cluster_id).ljust(5)} : size={str(self.size).ljust(10)}: {self.get_template()}"
@@ -68,7 +98,8 @@ class DrainBase(ABC):
                  extra_delimiters: Sequence[str] = (),
                  profiler: Profiler = NullProfiler(),
                  param_str: str = "<*>",
-                 parametrize_numeric_tokens: bool = True) -> None:
+                 parametrize_numeric_tokens: bool = True,
+                 deferred_masks: Optional[Mapping[str, Sequence[Pattern[str]]]] = None) -> None:
         """
         Create a new Drain instance.
 
@@ -86,6 +117,10 @@ class DrainBase(ABC):
         :param extra_delimiters: delimiters to apply when splitting log message into words (in addition to whitespace).
         :param parametrize_numeric_tokens: whether to treat tokens that contains at least one digit
             as template parameters.
+        :param deferred_masks: mapping of masks (e.g. "<NUM>") to the regexes a token has to fully match in order
+            to be considered an instance of that mask. When provided, log messages are expected to be unmasked:
+            tokens of new clusters are masked one by one, and incoming tokens are only matched against the masks
+            found in candidate templates during tree search and similarity comparison.
         """
         if depth < 3:
             raise ValueError("depth argument must be at least 3")
@@ -100,6 +135,7 @@ class DrainBase(ABC):
         self.max_clusters = max_clusters
         self.param_str = param_str
         self.parametrize_numeric_tokens = parametrize_numeric_tokens
+        self.deferred_masks: Mapping[str, Sequence[Pattern[str]]] = deferred_masks or {}
 
         self.id_to_cluster: MutableMapping[int, Optional[LogCluster]] = \
             {} if max_clusters is None else LogClusterCache(maxsize=max_clusters)
@@ -113,6 +149,38 @@ class DrainBase(ABC):
     def has_numbers(s: Iterable[str]) -> bool:
         return any(char.isdigit() for char in s)
 
+    def is_mask_match(self, mask: str, token: str) -> bool:
+        """
+        Check whether a token is an instance of a deferred mask.
+        """
+        regexes = self.deferred_masks.get(mask)
+        if regexes is None:
+            return False
+        return any(regex.fullmatch(token) for regex in regexes)
+
+    def mask_tokens(self, tokens: Sequence[str]) -> Sequence[str]:
+        """
+        Replace each token that fully matches a deferred mask with that mask (first matching mask wins).
+        """
+        masked_tokens = []
+        for token in tokens:
+            for mask, regexes in self.deferred_masks.items():
+                if any(regex.fullmatch(token) for regex in regexes):
+                    token = mask
+                    break
+            masked_tokens.append(token)
+        return masked_tokens
+
+    def get_mask_child_node(self, key_to_child_node: Mapping[str, Node], token: str) -> Optional[Node]:
+        """
+        Find a child node keyed by a deferred mask that the token is an instance of.
+        """
+        for mask, regexes in self.deferred_masks.items():
+            child_node = key_to_child_node.get(mask)
+            if child_node is not None and any(regex.fullmatch(token) for regex in regexes):
+                return child_node
+        return None
+
     def fast_match(self,
                    cluster_ids: Collection[int],
                    tokens: Sequence[str],
@@ -179,7 +247,7 @@ class DrainBase(ABC):
             print(out_str, file=file)
 
     def get_content_as_tokens(self, content: str) -> Sequence[str]:
-        content = content.strip()
+        # split() without arguments already drops leading and trailing whitespace, so no strip() is needed
         for delimiter in self.extra_delimiters:
             content = content.replace(delimiter, " ")
         content_tokens = content.split()
@@ -200,6 +268,8 @@ class DrainBase(ABC):
                 self.profiler.start_section("create_cluster")
             self.clusters_counter += 1
             cluster_id = self.clusters_counter
+            if self.deferred_masks:
+                content_tokens = self.mask_tokens(content_tokens)
             match_cluster = LogCluster(content_tokens, cluster_id)
             self.id_to_cluster[cluster_id] = match_cluster
             self.add_seq_to_prefix_tree(self.root_node, match_cluster)
@@ -213,7 +283,7 @@ class DrainBase(ABC):
             if tuple(new_template_tokens) == match_cluster.log_template_tokens:
                 update_type = "none"
             else:
-                match_cluster.log_template_tokens = tuple(new_template_tokens)
+                match_cluster.set_template_tokens(new_template_tokens)
                 update_type = "cluster_template_changed"
             match_cluster.size += 1
             # Touch cluster to update its state in the cache.
@@ -310,6 +380,8 @@ class Drain(DrainBase):
 
             key_to_child_node = cur_node.key_to_child_node
             cur_node = key_to_child_node.get(token)
+            if cur_node is None and self.deferred_masks:  # no exact next token exist, try mask nodes
+                cur_node = self.get_mask_child_node(key_to_child_node, token)
             if cur_node is None:  # no exact next token exist, try wildcard node
                 cur_node = key_to_child_node.get(self.param_str)
             if cur_node is None:  # no wildcard node exist
@@ -397,12 +469,13 @@ class Drain(DrainBase):
 
         sim_tokens = 0
         param_count = 0
+        deferred_masks = self.deferred_masks
 
         for token1, token2 in zip(seq1, seq2):
             if token1 == self.param_str:
                 param_count += 1
                 continue
-            if token1 == token2:
+            if token1 == token2 or (deferred_masks and self.is_mask_match(token1, token2)):
                 sim_tokens += 1
 
         if include_params:
@@ -422,6 +495,9 @@ class Drain(DrainBase):
         :return: template sequence with param_str in place of unmatched tokens
         """
         assert len(seq1) == len(seq2)
+        if self.deferred_masks:
+            return [token2 if token1 == token2 or self.is_mask_match(token2, token1) else self.param_str
+                    for token1, token2 in zip(seq1, seq2)]
         return [token2 if token1 == token2 else self.param_str for token1, token2 in zip(seq1, seq2)]
 
     def match(self, content: str, full_search_strategy: str = "never") -> Optional[LogCluster]:
@@ -2,7 +2,7 @@
 
 import abc
 import re
-from typing import cast, Collection, Dict, List
+from typing import cast, Collection, Dict, List, Pattern
 
 
 class AbstractMaskingInstruction(abc.ABC):
@@ -66,6 +66,20 @@ class LogMasker:
     def instructions_by_mask_name(self, mask_name: str) -> Collection[AbstractMaskingInstruction]:
         return cast(Collection[AbstractMaskingInstruction], self.mask_name_to_instructions.get(mask_name, []))
 
+    def regexes_by_mask(self) -> Dict[str, List[Pattern[str]]]:
+        """
+        Map each mask, as it appears in templates (i.e. including prefix and suffix), to the compiled regexes
+        of its masking instructions, in instruction order.
+        Only regex based masking instructions are supported.
+        """
+        mask_to_regexes: Dict[str, List[Pattern[str]]] = {}
+        for mi in self.masking_instructions:
+            if not isinstance(mi, MaskingInstruction):
+                raise ValueError(f"Masking instruction for {mi.mask_with} is not regex based")
+            mask = self.mask_prefix + mi.mask_with + self.mask_suffix
+            mask_to_regexes.setdefault(mask, []).append(mi.regex)
+        return mask_to_regexes
+
 # Some masking examples
 # ---------------------
 #
@@ -2,10 +2,11 @@
 
 import base64
 import logging
+import pickle
 import re
 import time
 import zlib
-from typing import Optional, Mapping, MutableMapping, NamedTuple, Sequence, Tuple, Union
+from typing import Iterable, List, Optional, Mapping, MutableMapping, NamedTuple, Sequence, Tuple, Union
 
 import jsonpickle  # type: ignore[import]
 from cachetools import LRUCache, cachedmethod
@@ -50,6 +51,10 @@ class TemplateMiner:
 
         self.persistence_handler = persistence_handler
 
+        if self.config.snapshot_format not in ["jsonpickle", "pickle"]:
+            raise ValueError(f"Invalid snapshot format: {self.config.snapshot_format}, "
+                             f"must be either 'jsonpickle' or 'pickle'")
+
         param_str = f"{self.config.mask_prefix}*{self.config.mask_suffix}"
 
         # Follow the configuration in the configuration file to instantiate Drain
@@ -58,6 +63,18 @@ class TemplateMiner:
         if target_obj not in ["Drain", "JaccardDrain"]:
             raise ValueError(f"Invalid matched_pattern: {target_obj}, must be either 'Drain' or 'JaccardDrain'")
 
+        self.masker = LogMasker(self.config.masking_instructions, self.config.mask_prefix, self.config.mask_suffix)
+
+        # With deferred masking, masks are matched by Drain against single tokens instead of masking messages upfront.
+        deferred_masks = None
+        if self.config.defer_masking:
+            if target_obj != "Drain":
+                raise ValueError(f"Deferred masking is not supported by {target_obj}")
+            deferred_masks = self.masker.regexes_by_mask()
+            logger.warning("Deferred masking is enabled: masks are matched against whole tokens only, so masks which "
+                           "depend on surrounding text or span several tokens behave differently than with "
+                           "upfront masking")
+
         self.drain: DrainBase = globals()[target_obj](
             sim_th=self.config.drain_sim_th,
             depth=self.config.drain_depth,
@@ -66,12 +83,15 @@ class TemplateMiner:
             extra_delimiters=self.config.drain_extra_delimiters,
             profiler=self.profiler,
             param_str=param_str,
-            parametrize_numeric_tokens=self.config.parametrize_numeric_tokens
+            parametrize_numeric_tokens=self.config.parametrize_numeric_tokens,
+            deferred_masks=deferred_masks
         )
 
-        self.masker = LogMasker(self.config.masking_instructions, self.config.mask_prefix, self.config.mask_suffix)
         self.parameter_extraction_cache: MutableMapping[Tuple[str, bool], str] = \
             LRUCache(self.config.parameter_extraction_cache_capacity)
+        self.masking_cache: Optional[MutableMapping[str, str]] = None
+        if self.config.masking_cache_capacity > 0:
+            self.masking_cache = LRUCache(self.config.masking_cache_capacity)
         self.last_save_time = time.time()
 
         if persistence_handler is not None:
@@ -90,7 +110,11 @@ class TemplateMiner:
         if self.config.snapshot_compress_state:
             state = zlib.decompress(base64.b64decode(state))
 
-        loaded_drain: Drain = jsonpickle.loads(state, keys=True)
+        loaded_drain: Drain
+        if self.config.snapshot_format == "pickle":
+            loaded_drain = pickle.loads(state)
+        else:
+            loaded_drain = jsonpickle.loads(state, keys=True)
 
         # json-pickle encoded keys as string by default, so we have to convert those back to int
         # this is only relevant for backwards compatibility when loading a snapshot of drain <= v0.9.1
@@ -112,7 +136,10 @@ class TemplateMiner:
     def save_state(self, snapshot_reason: str) -> None:
         assert self.persistence_handler is not None
 
-        state = jsonpickle.dumps(self.drain, keys=True).encode('utf-8')
+        if self.config.snapshot_format == "pickle":
+            state = pickle.dumps(self.drain, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            state = jsonpickle.dumps(self.drain, keys=True).encode('utf-8')
         if self.config.snapshot_compress_state:
             state = base64.b64encode(zlib.compress(state))
 
@@ -131,12 +158,29 @@ class TemplateMiner:
 
         return None
 
+    def mask(self, log_message: str) -> str:
+        """
+        Apply masking instructions to a log message.
+        Results are cached per log message when `masking_cache_capacity` is configured.
+        """
+        if self.masking_cache is None:
+            return self.masker.mask(log_message)
+
+        masked_content = self.masking_cache.get(log_message)
+        if masked_content is None:
+            masked_content = self.masker.mask(log_message)
+            self.masking_cache[log_message] = masked_content
+        return masked_content
+
     def add_log_message(self, log_message: str) -> Mapping[str, Union[str, int]]:
         self.profiler.start_section("total")
 
-        self.profiler.start_section("mask")
-        masked_content = self.masker.mask(log_message)
-        self.profiler.end_section()
+        if self.config.defer_masking:
+            masked_content = log_message
+        else:
+            self.profiler.start_section("mask")
+            masked_content = self.mask(log_message)
+            self.profiler.end_section()
 
         self.profiler.start_section("drain")
         cluster, change_type = self.drain.add_log_message(masked_content)
@@ -161,6 +205,18 @@ class TemplateMiner:
         self.profiler.report(self.config.profiling_report_sec)
         return result
 
+    def add_log_messages_batch(self, log_messages: Iterable[str]) -> List[Mapping[str, Union[str, int]]]:
+        """
+        Add a batch of log messages, in order, exactly as if `add_log_message()` was called for each of them.
+        Method lookups are resolved once per batch instead of once per message, which reduces per-message
+        overhead when feeding large files.
+
+        :param log_messages: log messages to add
+        :return: list of results (see `add_log_message()`), one per log message, in the same order
+        """
+        add_log_message = self.add_log_message
+        return [add_log_message(log_message) for log_message in log_messages]
+
     def match(self, log_message: str, full_search_strategy: str = "never") -> Optional[LogCluster]:
         """
         Mask log message and match against an already existing cluster.
@@ -181,7 +237,7 @@ class TemplateMiner:
         :return: Matched cluster or None if no match found.
         """
 
-        masked_content = self.masker.mask(log_message)
+        masked_content = log_message if self.config.defer_masking else self.mask(log_message)
         matched_cluster = self.drain.match(masked_content, full_search_strategy)
         return matched_cluster
 
@@ -18,6 +18,7 @@ class TemplateMinerConfig:
         self.profiling_report_sec = 60
         self.snapshot_interval_minutes = 5
         self.snapshot_compress_state = True
+        self.snapshot_format = "jsonpickle"
         self.drain_extra_delimiters: Collection[str] = []
         self.drain_sim_th = 0.4
         self.drain_depth = 4
@@ -27,7 +28,9 @@ class TemplateMinerConfig:
         self.mask_prefix = "<"
         self.mask_suffix = ">"
         self.parameter_extraction_cache_capacity = 3000
+        self.masking_cache_capacity = 0
         self.parametrize_numeric_tokens = True
+        self.defer_masking = False
 
     def load(self, config_filename: str) -> None:
         parser = configparser.ConfigParser()
@@ -51,6 +54,7 @@ class TemplateMinerConfig:
                                                        fallback=self.snapshot_interval_minutes)
         self.snapshot_compress_state = parser.getboolean(section_snapshot, 'compress_state',
                                                          fallback=self.snapshot_compress_state)
+        self.snapshot_format = parser.get(section_snapshot, 'format', fallback=self.snapshot_format)
 
         drain_extra_delimiters_str = parser.get(section_drain, 'extra_delimiters',
                                                 fallback=str(self.drain_extra_delimiters))
@@ -73,6 +77,9 @@ class TemplateMinerConfig:
         self.mask_suffix = parser.get(section_masking, 'mask_suffix', fallback=self.mask_suffix)
         self.parameter_extraction_cache_capacity = parser.getint(section_masking, 'parameter_extraction_cache_capacity',
                                                                  fallback=self.parameter_extraction_cache_capacity)
+        self.masking_cache_capacity = parser.getint(section_masking, 'masking_cache_capacity',
+                                                    fallback=self.masking_cache_capacity)
+        self.defer_masking = parser.getboolean(section_masking, 'defer_masking', fallback=self.defer_masking)
 
         masking_instructions = []
         masking_list = json.loads(masking_instructions_str)
@@ -1,5 +1,4 @@
 # SPDX-License-Identifier: MIT
-import json
 import logging
 import sys
 import time
@@ -7,10 +6,13 @@ import argparse
 import os
 from os.path import dirname, abspath
 import csv
+from itertools import islice
 
 from drain3 import TemplateMiner
 from drain3.template_miner_config import TemplateMinerConfig
 
+from example_utils import BufferedFileHandler, dumps, get_batch_mask, get_largest_clusters
+
 def setup_logging(output_file):
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
@@ -20,58 +22,79 @@ def setup_logging(output_file):
     stream_handler.setFormatter(formatter)
     logger.addHandler(stream_handler)
 
-    file_handler = logging.FileHandler(output_file, mode="w")
+    file_handler = BufferedFileHandler(output_file, mode="w", encoding="utf-8", delay=True)
     file_handler.setFormatter(formatter)
     logger.addHandler(file_handler)
 
     return logger
 
-def process_log_file(log_file_path, template_miner, logger, batch_size=10000):
+def iter_chunks(iterable, chunk_size=8192):
+    """Yields consecutive lists of up to 'chunk_size' items from 'iterable'."""
+    it = iter(iterable)
+    chunk = list(islice(it, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(it, chunk_size))
+
+def process_log_file(log_file_path, template_miner, logger, batch_size=8192):
+    batch_mask = get_batch_mask(batch_size)
+    log_info = logger.info
+    perf_counter = time.perf_counter
+    add_log_messages_batch = template_miner.add_log_messages_batch
+    clusters = template_miner.drain.clusters  # live view, stays up to date as clusters are added
     line_count = 0
-    start_time = time.time()
+    start_time = perf_counter()
     with open(log_file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            result = template_miner.add_log_message(line)
-            line_count += 1
-
-            if line_count % batch_size == 0:
-                elapsed = time.time() - start_time
-                rate = batch_size / elapsed
-                logger.info(f"[LOG] Processed line: {line_count}, rate={rate:.1f} lines/sec, "
-                            f"clusters={len(template_miner.drain.clusters)}")
-                start_time = time.time()
-
-            if result["change_type"] != "none":
-                logger.info(f"Input ({line_count}): {line}")
-                logger.info(f"Result: {json.dumps(result)}")
+        # chunks of batch_size lines, so that the rate below is measured over whole chunks
+        for chunk in iter_chunks((line.strip() for line in f), batch_size):
+            results = add_log_messages_batch(chunk)
+            for line, result in zip(chunk, results):
+                line_count += 1
+
+                if (line_count & batch_mask) == 0:
+                    elapsed = perf_counter() - start_time
+                    rate = batch_size / elapsed
+                    log_info(f"[LOG] Processed line: {line_count}, rate={rate:.1f} lines/sec, "
+                             f"clusters={len(clusters)}")
+                    start_time = perf_counter()
+
+                if result["change_type"] != "none":
+                    log_info(f"Input ({line_count}): {line}")
+                    log_info(f"Result: {dumps(result)}")
 
     logger.info(f"Done processing {line_count} lines from {log_file_path}. "
-                f"Total clusters = {len(template_miner.drain.clusters)}")
-
-def process_csv_file(csv_file_path, template_miner, logger, content_column="Content", batch_size=10000):
+                f"Total clusters = {len(clusters)}")
+
+def process_csv_file(csv_file_path, template_miner, logger, content_column="Content", batch_size=8192):
+    batch_mask = get_batch_mask(batch_size)
+    log_info = logger.info
+    perf_counter = time.perf_counter
+    add_log_messages_batch = template_miner.add_log_messages_batch
+    clusters = template_miner.drain.clusters  # live view, stays up to date as clusters are added
     line_count = 0
-    start_time = time.time()
+    start_time = perf_counter()
     with open(csv_file_path, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            line = row[content_column].strip()
-            result = template_miner.add_log_message(line)
-            line_count += 1
-
-            if line_count % batch_size == 0:
-                elapsed = time.time() - start_time
-                rate = batch_size / elapsed
-                logger.info(f"[CSV] Processed line: {line_count}, rate={rate:.1f} lines/sec, "
-                            f"clusters={len(template_miner.drain.clusters)}")
-                start_time = time.time()
-
-            if result["change_type"] != "none":
-                logger.info(f"Input ({line_count}): {line}")
-                logger.info(f"Result: {json.dumps(result)}")
+        reader = csv.reader(f)
+        header = next(reader, None)
+        content_index = header.index(content_column) if header else None
+        for chunk in iter_chunks((row[content_index].strip() for row in reader), batch_size):
+            results = add_log_messages_batch(chunk)
+            for line, result in zip(chunk, results):
+                line_count += 1
+
+                if (line_count & batch_mask) == 0:
+                    elapsed = perf_counter() - start_time
+                    rate = batch_size / elapsed
+                    log_info(f"[CSV] Processed line: {line_count}, rate={rate:.1f} lines/sec, "
+                             f"clusters={len(clusters)}")
+                    start_time = perf_counter()
+
+                if result["change_type"] != "none":
+                    log_info(f"Input ({line_count}): {line}")
+                    log_info(f"Result: {dumps(result)}")
 
     logger.info(f"Done processing {line_count} lines from CSV ({csv_file_path}). "
-                f"Total clusters = {len(template_miner.drain.clusters)}")
+                f"Total clusters = {len(clusters)}")
 
 def main():
     parser = argparse.ArgumentParser(description="Drain3 Demo with CSV or raw log.")
@@ -85,6 +108,15 @@ def main():
                         help="Name of the dataset, used to name the output file.")
     parser.add_argument("--results_folder", default="results",
                         help="Name of the folder where logs are saved (default: 'results').")
+    parser.add_argument("--defer_masking", action="store_true",
+                        help="Match single tokens against masks at similarity time instead of masking each line. "
+                             "Several masks in drain3.ini depend on surrounding text or span several tokens, so "
+                             "templates differ from those of upfront masking.")
+    parser.add_argument("--top_clusters", type=int, default=200,
+                        help="How many of the largest clusters to print (default=200, 0 prints all).")
+    parser.add_argument("--masking_cache_capacity", type=int, default=0,
+                        help="Number of distinct lines whose masked form is cached (default=0, no cache). "
+                             "Only useful when lines repeat, e.g. CSV content without timestamps.")
     args = parser.parse_args()
 
     # Make sure the folder for results exists
@@ -104,19 +136,21 @@ def main():
     config_file = f"{dirname(abspath(__file__))}/drain3.ini"
     config.load(config_file)
     config.profiling_enabled = True
+    config.masking_cache_capacity = args.masking_cache_capacity
+    config.defer_masking = args.defer_masking
 
     # Create TemplateMiner
     template_miner = TemplateMiner(config=config)
 
     # Process input
-    overall_start = time.time()
+    overall_start = time.perf_counter()
     if args.mode == "log":
         process_log_file(args.path, template_miner, logger)
     else:
         process_csv_file(args.path, template_miner, logger, content_column=args.content_column)
 
     # Print the summary of discovered clusters
-    sorted_clusters = sorted(template_miner.drain.clusters, key=lambda it: it.size, reverse=True)
+    sorted_clusters = get_largest_clusters(template_miner.drain.clusters, args.top_clusters)
     logger.info("== Cluster List (sorted by size) ==")
     for c in sorted_clusters:
         logger.info(str(c))
@@ -125,7 +159,7 @@ def main():
     template_miner.drain.print_tree()
 
     # Profiling info
-    total_time = time.time() - overall_start
+    total_time = time.perf_counter() - overall_start
     template_miner.profiler.report(0)
     logger.info(f"Completed in {total_time:.2f} seconds.")
 
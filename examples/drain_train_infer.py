@@ -1,6 +1,7 @@
-import json
 import logging
+import multiprocessing
 import sys
+import threading
 import time
 import argparse
 import os
@@ -11,6 +12,8 @@ from drain3 import TemplateMiner
 from drain3.template_miner_config import TemplateMinerConfig
 from drain3.file_persistence import FilePersistence  
 
+from example_utils import BufferedFileHandler, dumps, get_batch_mask, get_largest_clusters
+
 def setup_logging(output_file):
     """
     Sets up logging to both stdout and a specified output file.
@@ -23,54 +26,161 @@ def setup_logging(output_file):
     stream_handler.setFormatter(formatter)
     logger.addHandler(stream_handler)
 
-    file_handler = logging.FileHandler(output_file, mode="w")
+    file_handler = BufferedFileHandler(output_file, mode="w", encoding="utf-8", delay=True)
     file_handler.setFormatter(formatter)
     logger.addHandler(file_handler)
 
     return logger
 
-def load_lines_from_logfile(log_file_path):
-    """Loads lines from a .log text file into memory, strips them."""
-    with open(log_file_path, "r", encoding="utf-8") as f:
-        return [line.strip() for line in f]
+def iter_line_chunks(blocks):
+    """
+    Yields the stripped lines of a .log text file, given as consecutive byte blocks, as lists, one list per block.
+    Each block is decoded and split on newlines in one go.
+    """
+    remainder = b""
+    for data in blocks:
+        end = data.rfind(b"\n") + 1
+        if end == 0:  # no complete line in this block yet
+            remainder += data
+            continue
+        lines = str(remainder + data[:end], "utf-8", "replace").split("\n")
+        lines.pop()  # the block ends with a newline, which does not start another line
+        remainder = data[end:]
+        yield list(map(str.strip, lines))
+    if remainder:
+        yield [str(remainder, "utf-8", "replace").strip()]
+
+class BackgroundLoadedLines:
+    """
+    Read-only sequence of the lines of a .log text file, which are loaded by a reader thread, so that loading
+    overlaps with consuming the lines already loaded.
+    The reader thread reads the file once, block by block, and publishes the decoded and stripped lines of each
+    block as soon as it was read. The line count is only known once the whole file was read: len() blocks until
+    then, while iter_loading() already yields the lines loaded so far.
+    Accessing a line that was not loaded yet blocks until it is; iterating waits until all lines are loaded.
+    """
+
+    def __init__(self, log_file_path, chunk_size=1 << 22):
+        self._lines = []
+        self._loaded = threading.Condition()
+        self._done = False
+        self._error = None
+        threading.Thread(target=self._load, args=(log_file_path, chunk_size), daemon=True).start()
+
+    def _load(self, log_file_path, chunk_size):
+        try:
+            with open(log_file_path, "rb") as f:
+                for chunk in iter_line_chunks(iter(lambda: f.read(chunk_size), b"")):
+                    with self._loaded:
+                        self._lines.extend(chunk)
+                        self._loaded.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._loaded:
+                self._done = True
+                self._loaded.notify_all()
+
+    def _wait_until(self, predicate):
+        with self._loaded:
+            self._loaded.wait_for(lambda: self._done or predicate())
+        if self._error is not None:
+            raise self._error
+
+    @property
+    def line_count(self):
+        """Number of lines, or None while the file is still being read."""
+        return len(self._lines) if self._done else None
+
+    def iter_loading(self):
+        """
+        Yields the lines in order as they are loaded, and stops as soon as the whole file was read
+        (i.e. once line_count is known), possibly before yielding all lines.
+        """
+        index = 0
+        while True:
+            self._wait_until(lambda: len(self._lines) > index)
+            if self._done:
+                return
+            loaded = len(self._lines)
+            while index < loaded and not self._done:
+                yield self._lines[index]
+                index += 1
+
+    def __len__(self):
+        if not self._done:
+            self._wait_until(lambda: False)
+        return len(self._lines)
+
+    def __getitem__(self, index):
+        if index >= len(self._lines):
+            self._wait_until(lambda: len(self._lines) > index)
+        return self._lines[index]
+
+    def __iter__(self):
+        self._wait_until(lambda: False)
+        return iter(self._lines)
 
 def load_lines_from_csv(csv_file_path, content_column="Content"):
     """Loads lines from a CSV file, returns a list of strings (the log content)."""
-    lines = []
     with open(csv_file_path, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            raw_line = row[content_column].strip()
-            lines.append(raw_line)
-    return lines
-
-def train_on_subset(template_miner, lines, subset_ratio=0.1, logger=None):
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return []
+        content_index = header.index(content_column)
+        return [row[content_index].strip() for row in reader]
+
+def iter_training_lines(lines, subset_ratio):
+    """
+    Yields the first 'subset_ratio' portion of lines (at least one line).
+    For BackgroundLoadedLines, lines are yielded while the file is still being read and the line count
+    is unknown, so when reading is slower than training, more than 'subset_ratio' of the lines may be yielded.
     """
-    Train the template miner on the first 'subset_ratio' portion of lines.
+    consumed = 0
+    if isinstance(lines, BackgroundLoadedLines):
+        for line in lines.iter_loading():
+            yield line
+            consumed += 1
+
+    line_count = len(lines)
+    num_train = max(int(line_count * subset_ratio), min(1, line_count), consumed)
+    for i in range(consumed, num_train):
+        yield lines[i]
+
+def train_on_subset(template_miner, lines, subset_ratio=0.1, logger=None, batch_size=1024, top_clusters=200):
+    """
+    Train the template miner on the first 'subset_ratio' portion of lines (see iter_training_lines()).
     For example, if subset_ratio=0.1, trains on first 10% of lines.
+    Training rate is logged every 'batch_size' lines (a power of two).
+    The 'top_clusters' largest clusters are printed after training (0 prints all).
+    Returns the number of lines trained on.
     """
-    num_train = int(len(lines) * subset_ratio)
-    if num_train == 0:
-        num_train = 1  # Ensure at least one line is used for training
-
-    logger.info(f"Training on first {num_train} lines (out of {len(lines)})...")
-    start_time = time.time()
-    for i in range(num_train):
-        line = lines[i]
-        result = template_miner.add_log_message(line)
-        if i % 1000 == 0 and i > 0:
-            elapsed = time.time() - start_time
-            rate = 1000 / elapsed
-            logger.info(f"Training line: {i}, rate={rate:.1f} lines/sec, "
-                        f"clusters={len(template_miner.drain.clusters)}")
-            start_time = time.time()
+    logger.info(f"Training on first {subset_ratio:.1%} of lines...")
+    batch_mask = get_batch_mask(batch_size)
+    log_info = logger.info
+    perf_counter = time.perf_counter
+    add_log_message = template_miner.add_log_message
+    clusters = template_miner.drain.clusters  # live view, stays up to date as clusters are added
+    num_train = 0
+    start_time = perf_counter()
+    for i, line in enumerate(iter_training_lines(lines, subset_ratio)):
+        num_train += 1
+        result = add_log_message(line)
+        if (i & batch_mask) == 0 and i > 0:
+            elapsed = perf_counter() - start_time
+            rate = batch_size / elapsed
+            log_info(f"Training line: {i}, rate={rate:.1f} lines/sec, "
+                     f"clusters={len(clusters)}")
+            start_time = perf_counter()
         if result["change_type"] != "none":
-            logger.info(f"InputTrain ({i+1}): {line}")
-            logger.info(f"Result: {json.dumps(result)}")
+            log_info(f"InputTrain ({i+1}): {line}")
+            log_info(f"Result: {dumps(result)}")
 
-    logger.info(f"Training completed. {len(template_miner.drain.clusters)} clusters formed so far.")
+    logger.info(f"Training completed on {num_train} lines (out of {len(lines)}). "
+                f"{len(clusters)} clusters formed so far.")
 
-    sorted_clusters = sorted(template_miner.drain.clusters, key=lambda it: it.size, reverse=True)
+    sorted_clusters = get_largest_clusters(clusters, top_clusters)
     logger.info("== Cluster Summary (After Training) ==")
     for c in sorted_clusters:
         logger.info(str(c))
@@ -88,8 +198,10 @@ def inference_on_remaining(template_miner, lines, start_index, logger=None):
     parsed_results = []
     total = len(lines)
     logger.info(f"Starting inference on lines {start_index+1}..{total}.")
-    start_time = time.time()
-    batch_size = 1000
+    perf_counter = time.perf_counter
+    start_time = perf_counter()
+    batch_size = 1024
+    batch_mask = get_batch_mask(batch_size)
     for i in range(start_index, total):
         line = lines[i]
         match_result = template_miner.match(line)  
@@ -98,31 +210,74 @@ def inference_on_remaining(template_miner, lines, start_index, logger=None):
             template_str = None
         else:
             cluster_id = match_result.cluster_id
-            template_str = " ".join(match_result.log_template_tokens)
+            template_str = match_result.get_template()
 
         parsed_results.append((i+1, line, cluster_id, template_str))
 
-        if (i - start_index) % batch_size == 0 and i > start_index:
-            elapsed = time.time() - start_time
+        if ((i - start_index) & batch_mask) == 0 and i > start_index:
+            elapsed = perf_counter() - start_time
             rate = batch_size / elapsed
             logger.info(f"[INFER] Processed line: {i+1}, rate={rate:.1f} lines/sec")
-            start_time = time.time()
+            start_time = perf_counter()
 
     logger.info("Inference complete.")
     return parsed_results
 
+def match_lines(template_miner, lines):
+    """
+    Matches 'lines' with 'template_miner'.
+    Returns a list of (cluster_id, template), with (None, None) for lines without a match.
+    """
+    match = template_miner.match
+    results = []
+    for line in lines:
+        match_result = match(line)
+        if match_result is None:
+            results.append((None, None))
+        else:
+            results.append((match_result.cluster_id, match_result.get_template()))
+    return results
+
+# template miner of an inference worker process, installed by _init_match_worker() in pool workers only
+_worker_template_miner = None
+
+def _init_match_worker(template_miner):
+    global _worker_template_miner
+    _worker_template_miner = template_miner
+
+def _match_lines_in_worker(lines):
+    return match_lines(_worker_template_miner, lines)
+
+def match_unique_lines(template_miner, lines, workers=1, chunk_size=4096):
+    """
+    Matches each distinct line only once.
+    Returns a dict of line -> (cluster_id, template), with (None, None) for lines without a match.
+    With workers > 1 the distinct lines are matched in chunks by a process pool. Matching never
+    modifies the model, so every worker gets its own read-only copy of the trained template miner
+    (shared copy-on-write where processes are forked).
+    """
+    unique_lines = list(set(lines))
+    if workers <= 1:
+        return dict(zip(unique_lines, match_lines(template_miner, unique_lines)))
+
+    chunks = [unique_lines[i:i + chunk_size] for i in range(0, len(unique_lines), chunk_size)]
+    matches = {}
+    with multiprocessing.Pool(workers, initializer=_init_match_worker, initargs=(template_miner,)) as pool:
+        for chunk, results in zip(chunks, pool.imap(_match_lines_in_worker, chunks)):
+            matches.update(zip(chunk, results))
+    return matches
+
 def save_parsed_csv(output_csv, parsed_lines):
     """
     Saves the final CSV with columns: [LineId, Content, EventId, EventTemplate].
-    'parsed_lines' is a list of tuples or dicts with that info.
+    'parsed_lines' is an iterable (e.g. a generator) of tuples with that info; rows are written
+    as they are produced, by a single writerows() call, through a 1 MB write buffer.
     """
-    import csv
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)
-    with open(output_csv, "w", newline="", encoding="utf-8") as f:
+    with open(output_csv, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
         writer = csv.writer(f)
         writer.writerow(["LineId", "Content", "EventId", "EventTemplate"])
-        for row in parsed_lines:
-            writer.writerow(row)
+        writer.writerows(parsed_lines)
 
 def main():
     parser = argparse.ArgumentParser(description="Train on first 10%, then inference on entire file.")
@@ -139,7 +294,14 @@ def main():
     parser.add_argument("--subset_ratio", type=float, default=0.1,
                         help="Fraction of lines to use for training (default=0.1 for 10%).")
     parser.add_argument("--persistence_file", default=None,
-                        help="Where to save or load the Drain3 state snapshot (JSON). If omitted, no file persistence.")
+                        help="Where to save or load the Drain3 state snapshot (pickle). If omitted, no file persistence.")
+    parser.add_argument("--top_clusters", type=int, default=200,
+                        help="How many of the largest clusters to print (default=200, 0 prints all).")
+    parser.add_argument("--masking_cache_capacity", type=int, default=0,
+                        help="Number of distinct lines whose masked form is cached (default=0, no cache). "
+                             "Only useful when lines repeat, e.g. CSV content without timestamps.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used for inference (default=1, 0 uses all CPUs).")
     args = parser.parse_args()
 
     if args.mode == "log":
@@ -160,29 +322,34 @@ def main():
     config_file = f"{dirname(abspath(__file__))}/drain3.ini"
     config.load(config_file)
     config.profiling_enabled = True
+    config.masking_cache_capacity = args.masking_cache_capacity
+    config.snapshot_format = "pickle"
 
     if args.persistence_file:
-        handler = FilePersistence(args.persistence_file)
-        config.persistence_handler = handler
         logger.info(f"[INFO] Using file persistence at {args.persistence_file}")
     else:
         logger.info("[INFO] No persistence file specified; no state saving will occur.")
 
+    # the training miner has no persistence handler, so that no snapshots are taken while training;
+    # a single snapshot is saved once training is done
     template_miner = TemplateMiner(config=config)
 
     if args.mode == "log":
-        lines = load_lines_from_logfile(args.path)
+        # lines are loaded in a background thread while training already consumes the first ones
+        lines = BackgroundLoadedLines(args.path)
+        logger.info(f"Loading lines from {args.path} in the background")
     else:
         lines = load_lines_from_csv(args.path, content_column=args.content_column)
-
-    logger.info(f"Loaded {len(lines)} lines total from {args.path}")
+        logger.info(f"Loaded {len(lines)} lines total from {args.path}")
 
     # 5) training on first 10%
-    n_train = train_on_subset(template_miner, lines, subset_ratio=args.subset_ratio, logger=logger)
+    n_train = train_on_subset(template_miner, lines, subset_ratio=args.subset_ratio, logger=logger,
+                              top_clusters=args.top_clusters)
 
     # 6) save the snapshot if we have file persistence
-    if template_miner.persistence_handler is not None and args.persistence_file:
-        template_miner.persistence_handler.save_state(template_miner.drain)
+    if args.persistence_file:
+        template_miner.persistence_handler = FilePersistence(args.persistence_file)
+        template_miner.save_state("training_done")
         logger.info(f"[INFO] State saved to {args.persistence_file}")
     else:
         logger.info("[INFO] No file persistence to save.")
@@ -191,11 +358,10 @@ def main():
         inf_config = TemplateMinerConfig()
         inf_config.load(config_file)
         inf_config.profiling_enabled = True
+        inf_config.masking_cache_capacity = config.masking_cache_capacity
+        inf_config.snapshot_format = config.snapshot_format
 
-        inf_handler = FilePersistence(args.persistence_file)
-        inf_config.persistence_handler = inf_handler
-
-        template_miner_inference = TemplateMiner(config=inf_config)
+        template_miner_inference = TemplateMiner(FilePersistence(args.persistence_file), inf_config)
         logger.info(f"[INFO] Created new TemplateMiner for inference by reloading state from {args.persistence_file}")
     else:
         template_miner_inference = template_miner
@@ -204,30 +370,22 @@ def main():
         else:
             logger.info("[INFO] No persistence file specified; reusing training model for inference.")
 
-    # 8) Inference on entire file
-    parsed_lines = []
-    start_time = time.time()
-    for i, line in enumerate(lines):
-        match_result = template_miner_inference.match(line)
-        if match_result is None:
-            cluster_id = None
-            template_str = None
-        else:
-            cluster_id = match_result.cluster_id
-            template_str = " ".join(match_result.log_template_tokens)
-        parsed_lines.append((i+1, line, cluster_id, template_str))
+    # 8) Inference on entire file - duplicate lines share the match of their first occurrence
+    start_time = time.perf_counter()
+    workers = args.workers or os.cpu_count() or 1
+    matches = match_unique_lines(template_miner_inference, lines, workers=workers)
 
-    total_time = time.time() - start_time
+    total_time = time.perf_counter() - start_time
     logger.info(f"Inference for all lines took {total_time:.2f} seconds.")
 
-    # 9) Save final CSV
+    # 9) Save final CSV, streaming the (LineId, Content, EventId, EventTemplate) rows
+    parsed_lines = ((i+1, line) + matches[line] for i, line in enumerate(lines))
     save_parsed_csv(output_csv, parsed_lines)
     logger.info(f"Saved final parsed CSV to: {output_csv}")
 
     # 10) Print final summaries (after inference)
     logger.info("== Final Cluster Summary ==")
-    sorted_clusters = sorted(template_miner_inference.drain.clusters,
-                             key=lambda it: it.size, reverse=True)
+    sorted_clusters = get_largest_clusters(template_miner_inference.drain.clusters, args.top_clusters)
     for c in sorted_clusters:
         logger.info(str(c))
 
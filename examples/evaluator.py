@@ -14,8 +14,99 @@ An all-in-one script that:
 import os
 import sys
 import csv
+import numpy as np
 import pandas as pd
-from scipy.special import comb
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional - without it the kernels below run as plain Python
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True)
+def _count_pairs(counts):
+    """Number of line pairs within groups of the given sizes."""
+    total = 0
+    for count in counts:
+        total += count * (count - 1) // 2
+    return total
+
+
+@njit(cache=True)
+def _accurate(parsed_codes, gt_codes, gt_counts, parsed_event_count):
+    """
+    Count accurately parsed pairs and events in a single pass.
+
+    'parsed_codes' and 'gt_codes' are integer codes of the parsed and groundtruth event of each line, sorted by
+    (parsed, groundtruth). Lines without a groundtruth event have a negative groundtruth code.
+    'gt_counts' holds the number of lines of each groundtruth event.
+
+    Returns (accurate_pairs, accurate_events, is_accurate), where is_accurate[k] tells whether parsed event k
+    groups exactly the lines of one groundtruth event.
+    """
+    n = parsed_codes.size
+    accurate_pairs = 0
+    accurate_events = 0
+    is_accurate = np.zeros(parsed_event_count, dtype=np.bool_)
+    i = 0
+    while i < n:
+        parsed = parsed_codes[i]
+        gt = -1
+        gt_event_count = 0
+        j = i
+        while j < n and parsed_codes[j] == parsed:
+            k = j
+            while k < n and parsed_codes[k] == parsed and gt_codes[k] == gt_codes[j]:
+                k += 1
+            if gt_codes[j] >= 0:
+                run = k - j
+                accurate_pairs += run * (run - 1) // 2
+                gt = gt_codes[j]
+                gt_event_count += 1
+            j = k
+        size = j - i
+        if gt_event_count == 1 and size == gt_counts[gt]:
+            accurate_events += size
+            is_accurate[parsed] = True
+        i = j
+    return accurate_pairs, accurate_events, is_accurate
+
+
+def get_accuracy_from_codes(gt_codes, parsed_codes):
+    """
+    Compute accuracy metrics from integer event codes of aligned lines.
+
+    'gt_codes' and 'parsed_codes' hold, for each line, a non-negative code of its groundtruth and parsed event
+    (e.g. from pandas.factorize() or categorical codes), or a negative code when the line has no event.
+
+    Returns (precision, recall, f_measure, accuracy, is_accurate), where is_accurate[k] tells whether the
+    parsed event with code k was parsed accurately.
+    """
+    gt_codes = np.asarray(gt_codes)
+    parsed_codes = np.asarray(parsed_codes)
+    line_count = gt_codes.size
+
+    gt_counts = np.bincount(gt_codes[gt_codes >= 0])
+    real_pairs = _count_pairs(gt_counts)
+    parsed_pairs = _count_pairs(np.bincount(parsed_codes[parsed_codes >= 0]))
+
+    # lines that were not parsed into any event do not take part in accurate pairs/events
+    parsed_lines = parsed_codes >= 0
+    gt_codes = gt_codes[parsed_lines]
+    parsed_codes = parsed_codes[parsed_lines]
+    order = np.lexsort((gt_codes, parsed_codes))
+    parsed_event_count = int(parsed_codes.max()) + 1 if parsed_codes.size else 0
+    accurate_pairs, accurate_events, is_accurate = _accurate(
+        parsed_codes[order], gt_codes[order], gt_counts, parsed_event_count)
+
+    precision = float(accurate_pairs) / parsed_pairs if parsed_pairs != 0 else 0.0
+    recall = float(accurate_pairs) / real_pairs if real_pairs != 0 else 0.0
+    f_measure = 2.0 * precision * recall / (precision + recall) if (precision + recall) != 0 else 0.0
+    accuracy = float(accurate_events) / line_count if line_count != 0 else 0.0
+    return precision, recall, f_measure, accuracy, is_accurate
 
 def get_accuracy(series_groundtruth, series_parsedlog, debug=False):
     """
@@ -26,7 +117,7 @@ def get_accuracy(series_groundtruth, series_parsedlog, debug=False):
         series_groundtruth : pandas.Series
             A sequence of groundtruth event Ids
         series_parsedlog : pandas.Series
-            A sequence of parsed event Ids
+            A sequence of parsed event Ids, aligned with series_groundtruth
         debug : bool, default False
             print error log messages when set to True
 
@@ -37,46 +128,35 @@ def get_accuracy(series_groundtruth, series_parsedlog, debug=False):
         f_measure : float
         accuracy : float
     """
-    series_groundtruth_valuecounts = series_groundtruth.value_counts()
-    real_pairs = 0
-    for count in series_groundtruth_valuecounts:
-        if count > 1:
-            real_pairs += comb(count, 2)
-
-    series_parsedlog_valuecounts = series_parsedlog.value_counts()
-    parsed_pairs = 0
-    for count in series_parsedlog_valuecounts:
-        if count > 1:
-            parsed_pairs += comb(count, 2)
+    gt_codes = pd.factorize(series_groundtruth)[0]
+    parsed_codes, parsed_eventIds = pd.factorize(series_parsedlog)
 
-    accurate_pairs = 0
-    accurate_events = 0  
-    for parsed_eventId in series_parsedlog_valuecounts.index:
-        logIds = series_parsedlog[series_parsedlog == parsed_eventId].index
-        series_gt_valuecounts = series_groundtruth[logIds].value_counts()
+    precision, recall, f_measure, accuracy, is_accurate = get_accuracy_from_codes(gt_codes, parsed_codes)
 
-        error_eventIds = (parsed_eventId, series_gt_valuecounts.index.tolist())
-        error = True
-        if series_gt_valuecounts.size == 1:
-            groundtruth_eventId = series_gt_valuecounts.index[0]
-            if logIds.size == series_groundtruth[series_groundtruth == groundtruth_eventId].size:
-                accurate_events += logIds.size
-                error = False
+    if debug:
+        for parsed_eventId in parsed_eventIds[~is_accurate]:
+            gt_eventIds = series_groundtruth[series_parsedlog == parsed_eventId]
+            print("(parsed_eventId, groundtruth_eventId) =",
+                  (parsed_eventId, gt_eventIds.value_counts().index.tolist()),
+                  "failed", gt_eventIds.size, "messages")
 
-        if error and debug:
-            print("(parsed_eventId, groundtruth_eventId) =", error_eventIds,
-                  "failed", logIds.size, "messages")
+    return precision, recall, f_measure, accuracy
 
-        for count in series_gt_valuecounts:
-            if count > 1:
-                accurate_pairs += comb(count, 2)
+def read_event_ids(path):
+    """
+    Read the 'LineId' and 'EventId' columns of a CSV.
+    Returns (line_ids, event_codes), sorted by LineId, where event_codes are categorical codes of the EventIds
+    (-1 for lines without an EventId).
+    """
+    df = pd.read_csv(path, usecols=lambda column: column in ("LineId", "EventId"),
+                     dtype={"EventId": "category"}, engine="c")
+    if "LineId" not in df.columns:
+        raise ValueError("Both groundtruth and parsed CSV must have a 'LineId' column!")
 
-
-    precision = float(accurate_pairs) / parsed_pairs if parsed_pairs != 0 else 0.0
-    recall = float(accurate_pairs) / real_pairs if real_pairs != 0 else 0.0
-    f_measure = 2.0 * precision * recall / (precision + recall) if (precision + recall) != 0 else 0.0
-    accuracy = float(accurate_events) / series_groundtruth.size if series_groundtruth.size != 0 else 0.0
-    return precision, recall, f_measure, accuracy
+    line_ids = df["LineId"].to_numpy()
+    event_codes = df["EventId"].cat.codes.to_numpy()
+    order = np.argsort(line_ids, kind="stable")
+    return line_ids[order], event_codes[order]
 
 def evaluate(groundtruth, parsedresult):
     """
@@ -85,24 +165,19 @@ def evaluate(groundtruth, parsedresult):
 
     We explicitly align on 'LineId'.
     """
-    df_groundtruth = pd.read_csv(groundtruth)
-    df_parsedlog = pd.read_csv(parsedresult)
-
-    if "LineId" not in df_groundtruth.columns or "LineId" not in df_parsedlog.columns:
-        raise ValueError("Both groundtruth and parsed CSV must have a 'LineId' column!")
-
-    df_groundtruth.set_index("LineId", inplace=True)
-    df_parsedlog.set_index("LineId", inplace=True)
+    gt_line_ids, gt_codes = read_event_ids(groundtruth)
+    parsed_line_ids, parsed_codes = read_event_ids(parsedresult)
 
-    df_groundtruth = df_groundtruth[~df_groundtruth["EventId"].isnull()]
+    labelled = gt_codes >= 0
+    gt_line_ids = gt_line_ids[labelled]
+    gt_codes = gt_codes[labelled]
 
-    common_lineids = df_groundtruth.index.intersection(df_parsedlog.index)
-    df_groundtruth = df_groundtruth.loc[common_lineids]
-    df_parsedlog = df_parsedlog.loc[common_lineids]
+    # both LineId arrays are sorted, so the lines common to both files can be gathered with searchsorted
+    common_lineids = np.intersect1d(gt_line_ids, parsed_line_ids, assume_unique=True)
+    gt_codes = gt_codes[np.searchsorted(gt_line_ids, common_lineids)]
+    parsed_codes = parsed_codes[np.searchsorted(parsed_line_ids, common_lineids)]
 
-    precision, recall, f_measure, accuracy = get_accuracy(
-        df_groundtruth["EventId"], df_parsedlog["EventId"]
-    )
+    precision, recall, f_measure, accuracy, _ = get_accuracy_from_codes(gt_codes, parsed_codes)
     print(f"Precision: {precision:.4f}, Recall: {recall:.4f}, "
           f"F1_measure: {f_measure:.4f}, Parsing_Accuracy: {accuracy:.4f}")
     return f_measure, accuracy
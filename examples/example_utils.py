@@ -0,0 +1,53 @@
+# SPDX-License-Identifier: MIT
+"""
+Helpers shared by the drain_custom_big_file.py and drain_train_infer.py examples.
+"""
+import functools
+import heapq
+import json
+import logging
+import operator
+
+try:
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:  # orjson is optional - fall back to the standard library encoder, with the same compact output
+    dumps = functools.partial(json.dumps, separators=(",", ":"), ensure_ascii=False)
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that writes through a 1 MB stream buffer instead of flushing the file after every record.
+    The buffer is flushed when it fills up, when an error is logged and when the handler is closed.
+    """
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=1 << 20, encoding=self.encoding)
+
+    def flush(self):
+        # called by StreamHandler.emit() after every record - leave flushing to the stream buffer
+        pass
+
+    def emit(self, record):
+        super().emit(record)
+        if record.levelno >= logging.ERROR and self.stream is not None:
+            self.stream.flush()
+
+def get_batch_mask(batch_size):
+    """
+    Returns a mask for which 'count & mask == 0' holds once every 'batch_size' counts.
+    'batch_size' must be a power of two.
+    """
+    if batch_size <= 0 or batch_size & (batch_size - 1):
+        raise ValueError(f"batch_size must be a power of two, got {batch_size}")
+    return batch_size - 1
+
+def get_largest_clusters(clusters, top_clusters):
+    """
+    Returns the 'top_clusters' largest clusters, sorted by descending size (all clusters when 'top_clusters' is 0).
+    """
+    by_size = operator.attrgetter("size")
+    if top_clusters > 0:
+        return heapq.nlargest(top_clusters, clusters, key=by_size)
+    return sorted(clusters, key=by_size, reverse=True)
@@ -1,12 +1,21 @@
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-def parse_all_datasets(base_dir, parser_script="drain_train_infer.py"):
+def run_parser(cmd):
+    """Runs a single parser invocation; its console output is dropped (it is also saved in its results folder)."""
+    return subprocess.run(cmd, stdout=subprocess.DEVNULL)
+
+def parse_all_datasets(base_dir, parser_script="drain_train_infer.py", max_workers=None):
     """
     Recursively parse each dataset folder under `base_dir`.
     1) For each dataset folder, it looks for <dataset>_2k.log and <dataset>_2k.log_structured.csv.
     2) Calls 'drain_train_infer.py' to train on 10%, then run inference on entire file.
+    The invocations are independent of each other, so up to `max_workers` of them (default: half the CPUs)
+    run in parallel.
     """
+    commands = []
+    descriptions = []
     for entry in os.listdir(base_dir):
         dataset_path = os.path.join(base_dir, entry)
         if not os.path.isdir(dataset_path):
@@ -21,23 +30,22 @@ def parse_all_datasets(base_dir, parser_script="drain_train_infer.py"):
 
         # If the log file exists, run train_infer on it
         if os.path.isfile(log_file):
-            print(f"[parse_all] Processing LOG file for dataset '{dataset_name}': {log_file}")
-            snapshot_json = os.path.join(results_folder, f"{dataset_name}_snapshot_log.json")
-            subprocess.run([
+            snapshot_file = os.path.join(results_folder, f"{dataset_name}_snapshot_log.pkl")
+            commands.append([
                 "python", parser_script,
                 "--mode", "log",
                 "--path", log_file,
                 "--dataset", dataset_name,
                 "--results_folder", results_folder,
                 "--subset_ratio", "0.1",  # train on 10%
-                "--persistence_file", snapshot_json
+                "--persistence_file", snapshot_file
             ])
+            descriptions.append(f"LOG file for dataset '{dataset_name}': {log_file}")
 
         # If the CSV file exists, run train_infer on it
         if os.path.isfile(csv_file):
-            print(f"[parse_all] Processing CSV file for dataset '{dataset_name}': {csv_file}")
-            snapshot_json = os.path.join(results_folder, f"{dataset_name}_snapshot_csv.json")
-            subprocess.run([
+            snapshot_file = os.path.join(results_folder, f"{dataset_name}_snapshot_csv.pkl")
+            commands.append([
                 "python", parser_script,
                 "--mode", "csv",
                 "--path", csv_file,
@@ -45,8 +53,20 @@ def parse_all_datasets(base_dir, parser_script="drain_train_infer.py"):
                 "--results_folder", results_folder,
                 "--content_column", "Content",
                 "--subset_ratio", "0.1",
-                "--persistence_file", snapshot_json
+                "--persistence_file", snapshot_file
             ])
+            descriptions.append(f"CSV file for dataset '{dataset_name}': {csv_file}")
+
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 1) // 2)
+
+    # Each worker thread only waits on its child process, so threads are enough to run the parsers in parallel.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for cmd, description, completed in zip(commands, descriptions, executor.map(run_parser, commands)):
+            if completed.returncode != 0:
+                print(f"[parse_all] Failed (exit code {completed.returncode}): {' '.join(cmd)}")
+            else:
+                print(f"[parse_all] Processed {description}")
 
 # Example usage:
 if __name__ == "__main__":
@@ -2,6 +2,8 @@
 
 import unittest
 
+import jsonpickle  # type: ignore[import]
+
 from drain3.drain import Drain, LogCluster
 
 
@@ -271,4 +273,19 @@ class DrainTest(unittest.TestCase):
         self.assertListEqual(seq1, template)
 
         # Test for equal lengths input vectors
-        self.assertRaises(AssertionError, model.create_template, seq1, ["aa"])
\ No newline at end of file
+        self.assertRaises(AssertionError, model.create_template, seq1, ["aa"])
+
+    def test_cluster_template_cache(self):
+        model = Drain()
+        cluster, _ = model.add_log_message("aa bb cc")
+        self.assertEqual("aa bb cc", cluster.get_template())
+
+        cluster, change_type = model.add_log_message("aa bb dd")
+        self.assertEqual("cluster_template_changed", change_type)
+        self.assertEqual("aa bb <*>", cluster.get_template())
+
+        # clusters restored from snapshots taken before template caching have no cached template
+        restored = jsonpickle.loads('{"py/object": "drain3.drain.LogCluster", '
+                                    '"log_template_tokens": {"py/tuple": ["xx", "<*>"]}, '
+                                    '"cluster_id": 2, "size": 3}', keys=True)
+        self.assertEqual("xx <*>", restored.get_template())
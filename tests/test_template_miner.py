@@ -28,11 +28,32 @@ class TemplateMinerTest(unittest.TestCase):
     def test_save_load_snapshot_limited_clusters(self):
         self.save_load_snapshot(10)
 
-    def save_load_snapshot(self, max_clusters):
+    def test_save_load_snapshot_pickle_format(self):
+        self.save_load_snapshot(None, "pickle")
+        self.save_load_snapshot(10, "pickle")
+
+    def test_snapshot_excludes_cached_template(self):
+        for snapshot_format in ["jsonpickle", "pickle"]:
+            persistence = MemoryBufferPersistence()
+            config = TemplateMinerConfig()
+            config.snapshot_compress_state = False
+            config.snapshot_format = snapshot_format
+            template_miner1 = TemplateMiner(persistence, config)
+            template_miner1.add_log_message("hello ABC")
+            template_miner1.add_log_message("hello BCD")
+            template_miner1.save_state("test")
+            # "_template" on its own, not as part of "log_template_tokens"
+            self.assertNotRegex(persistence.state, rb"(?<![a-z])_template")
+
+            template_miner2 = TemplateMiner(persistence, config)
+            self.assertEqual("hello <*>", template_miner2.match("hello XYZ").get_template())
+
+    def save_load_snapshot(self, max_clusters, snapshot_format="jsonpickle"):
         persistence = MemoryBufferPersistence()
 
         config = TemplateMinerConfig()
         config.drain_max_clusters = max_clusters
+        config.snapshot_format = snapshot_format
         template_miner1 = TemplateMiner(persistence, config)
         print(template_miner1.add_log_message("hello"))
         print(template_miner1.add_log_message("hello ABC"))
@@ -381,3 +402,62 @@ class TemplateMinerTest(unittest.TestCase):
         self.assertIsNotNone(miner.match("", full_search_strategy="never"))
         self.assertIsNotNone(miner.match("", full_search_strategy="always"))
         self.assertIsNotNone(miner.match("", full_search_strategy="fallback"))
+
+    def test_add_log_messages_batch(self):
+        log_messages = ["aa aa aa", "aa aa bb", "xx yy zz", "rrr qqq 123", "aa aa cc"]
+
+        config = TemplateMinerConfig()
+        mi = MaskingInstruction("((?<=[^A-Za-z0-9])|^)([\\-\\+]?\\d+)((?=[^A-Za-z0-9])|$)", "NUM")
+        config.masking_instructions.append(mi)
+
+        miner1 = TemplateMiner(None, config)
+        expected = [miner1.add_log_message(log_message) for log_message in log_messages]
+
+        miner2 = TemplateMiner(None, config)
+        results = miner2.add_log_messages_batch(iter(log_messages))
+        self.assertListEqual(expected, results)
+        self.assertEqual("cluster_template_changed", results[1]["change_type"])
+        self.assertEqual("rrr qqq <NUM>", results[3]["template_mined"])
+
+    def test_defer_masking(self):
+        log_messages = ["user 12 logged in", "user 345 logged in", "user bob logged in",
+                        "connect to 10 failed", "connect to 11 failed", "connect to server failed",
+                        "12 items processed", "345 items processed"]
+
+        config = TemplateMinerConfig()
+        config.masking_instructions.append(
+            MaskingInstruction("((?<=[^A-Za-z0-9])|^)([\\-\\+]?\\d+)((?=[^A-Za-z0-9])|$)", "NUM"))
+        eager_miner = TemplateMiner(None, config)
+        expected = [eager_miner.add_log_message(log_message) for log_message in log_messages]
+
+        config.defer_masking = True
+        with self.assertLogs("drain3.template_miner", level="WARNING"):
+            deferred_miner = TemplateMiner(None, config)
+        results = [deferred_miner.add_log_message(log_message) for log_message in log_messages]
+        self.assertListEqual(expected, results)
+        self.assertEqual("user <NUM> logged in", results[1]["template_mined"])
+        self.assertEqual("none", results[7]["change_type"])
+
+        self.assertEqual(1, deferred_miner.match("user 6789 logged in").cluster_id)
+        self.assertIsNone(deferred_miner.match("user 6789 logged out"))
+
+        config.engine = "JaccardDrain"
+        with self.assertRaises(ValueError):
+            TemplateMiner(None, config)
+
+    def test_masking_cache(self):
+        config = TemplateMinerConfig()
+        config.masking_instructions.append(
+            MaskingInstruction("((?<=[^A-Za-z0-9])|^)([\\-\\+]?\\d+)((?=[^A-Za-z0-9])|$)", "NUM"))
+        self.assertIsNone(TemplateMiner(None, config).masking_cache)
+
+        config.masking_cache_capacity = 2
+        template_miner = TemplateMiner(None, config)
+        template_miner.add_log_message("job 1 done")
+        template_miner.add_log_message("job 2 done")
+        template_miner.add_log_message("job 1 done")
+        template_miner.add_log_message("job 3 done")
+        self.assertDictEqual({"job 1 done": "job <NUM> done", "job 3 done": "job <NUM> done"},
+                             dict(template_miner.masking_cache))
+        self.assertEqual(1, template_miner.match("job 2 done").cluster_id)
+        self.assertEqual(2, len(template_miner.masking_cache))